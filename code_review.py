@@ -9,14 +9,31 @@ Docker usage:
 """
 
 import os
-import json
+import atexit
+import hashlib
+import logging
+import queue
+import re
 import sys
+import tempfile
+import threading
+from collections.abc import Iterator
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+import ijson
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+logger = logging.getLogger("rejpal")
+
 # === Konfigurace z ENV ===
 GITLAB_URL = os.environ.get("CI_SERVER_URL", "https://gitlab.com")
 PROJECT_ID = os.environ.get("CI_PROJECT_ID")
+PROJECT_PATH = os.environ.get("CI_PROJECT_PATH")  # pro GraphQL; bez něj se dohledá přes REST
 MR_IID = os.environ.get("CI_MERGE_REQUEST_IID")
 GITLAB_TOKEN = os.environ.get("GITLAB_TOKEN")
 
@@ -36,12 +53,21 @@ ANTHROPIC_MODEL = os.environ.get("ANTHROPIC_MODEL", "claude-sonnet-4-20250514")
 # 4. Default pravidla v image
 REVIEW_RULES_FILE = os.environ.get("REVIEW_RULES_FILE", "/app/default_rules.md")
 REVIEW_RULES_CONTENT = os.environ.get("REVIEW_RULES_CONTENT", "")
+REVIEW_RULES = ""  # načtená pravidla (nastaví init_config)
+PROMPT_INTRO = ""  # jazykové části promptu (nastaví init_config)
+PROMPT_COMMENT_LANG = ""
 
 # Konfigurace review
 IGNORE_PATTERNS_EXTRA = os.environ.get("IGNORE_PATTERNS", "")  # čárkami oddělené
 REVIEW_EXTENSIONS_EXTRA = os.environ.get("REVIEW_EXTENSIONS", "")  # čárkami oddělené
 MAX_FILE_SIZE = int(os.environ.get("MAX_FILE_SIZE", "50000"))  # max velikost souboru v chars
+REVIEW_INCLUDE_FULL_FILE = os.environ.get("REVIEW_INCLUDE_FULL_FILE", "0") == "1"  # posílat AI i celý soubor
 LANGUAGE = os.environ.get("REVIEW_LANGUAGE", "cs")  # cs / en
+REVIEW_CACHE_DIR = os.environ.get("REVIEW_CACHE_DIR", "")  # adresář pro cache odpovědí AI (prázdné = vypnuto)
+MIN_LINES_FOR_REVIEW = int(os.environ.get("MIN_LINES_FOR_REVIEW", "3"))  # menší změny se neposílají AI
+RETRY_MAX_TOKENS = 4096  # limit pro opakovaný dotaz, když se odpověď AI nevešla
+REVIEW_CONCURRENCY = int(os.environ.get("REVIEW_CONCURRENCY", "6"))  # paralelně analyzované soubory
+GITLAB_CONCURRENCY = int(os.environ.get("GITLAB_CONCURRENCY", "10"))  # max souběžných požadavků na GitLab API
 
 # Základní ignorované patterns
 IGNORE_PATTERNS = [
@@ -62,10 +88,152 @@ REVIEW_EXTENSIONS = {
     ".cs", ".cpp", ".c", ".h", ".swift",
 }
 
+# Typ PHP souboru podle adresáře (první shoda vyhrává)
+PHP_FILE_TYPES = {
+    "/Controllers/": "Laravel Controller",
+    "/Models/": "Laravel Model",
+    "/Services/": "Laravel Service",
+    "/Requests/": "Laravel Form Request",
+    "/Resources/": "Laravel Resource",
+    "/Actions/": "Laravel Action",
+    "/Jobs/": "Laravel Job",
+    "/Events/": "Laravel Event",
+    "/Listeners/": "Laravel Listener",
+}
+
+# Začátek každého řádku diffu: hlavička hunku / přidaný / odebraný / "\ No newline" / kontext
+# Combined diff hlavičky ("@@@ ... @@@") se berou jako neplatný hunk - v MR diffech se nevyskytují
+_DIFF_LINE_RE = re.compile(
+    r"^(?:@@ -\d+(?:,\d+)? \+(?P<start>\d+)(?:,\d+)? @@|(?P<bad_hunk>@@)"
+    r"|(?P<sign>\+(?!\+\+)|-(?!--)|\\))?",
+    re.M,
+)
+
+# Obsah přidaných řádků diffu (bez "+")
+_ADDED_LINE_RE = re.compile(r"^\+(?!\+\+)(.*)$", re.M)
+
+# Přidané řádky, které samy o sobě nestojí za review
+_TRIVIAL_COMMENT_PREFIXES = ("#", "//", "/*", "* ", "*/")  # "* " a "*/" = řádky doc bloku
+# Řádky začínající "#", které nejsou komentář: atributy (PHP, Rust "#[...]" i "#![...]")
+_HASH_ATTRIBUTE_RE = re.compile(r"#!?\[")
+# ... a v jazycích rodiny C direktivy preprocesoru
+_C_FAMILY_SUFFIXES = frozenset({".c", ".h", ".cpp", ".cs"})
+_PREPROCESSOR_RE = re.compile(
+    r"#\s*(?:include|define|undef|if|ifdef|ifndef|elif|else|endif|pragma|error|warning|line|region|endregion)\b"
+)
+_TRIVIAL_IMPORT_PREFIXES = ("import ", "from ", "use ")
+
+# Předkompilované IGNORE_PATTERNS (sestaví init_config)
+_IGNORE_SUFFIXES: tuple[str, ...] = ()  # "*.lock" -> konec názvu souboru
+_IGNORE_RE: re.Pattern | None = None  # ostatní patterns -> podřetězec cesty
+
+# Schéma odpovědi AI - vynucené přes structured output (OpenAI) / tool use (Anthropic)
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "comments": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "line": {"type": "integer"},
+                    "severity": {"type": "string", "enum": ["critical", "warning", "suggestion"]},
+                    "message": {"type": "string"},
+                    "suggestion": {"type": "string"},
+                },
+                "required": ["line", "severity", "message", "suggestion"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["comments"],
+    "additionalProperties": False,
+}
+
+# Statický prefix promptu je pro všechny soubory MR stejný (cachuje ho provider)
+PROMPT_PREFIX_TEMPLATE = """{intro}
+
+## Pravidla a principy, které kontroluješ:
+{rules}
+
+## Tvůj úkol:
+1. Analyzuj POUZE změněné řádky (ne celý soubor)
+2. Hledej problémy s architekturou, designem, čitelností, principy SOLID, DRY atd.
+3. NEKOMENTUJ drobnosti jako chybějící mezery nebo formátování (to řeší linter)
+4. Komentuj pouze DŮLEŽITÉ problémy, které stojí za pozornost
+
+## Formát odpovědi:
+Vrať JSON objekt {{"comments": [...]}}. Každý komentář v poli "comments" má:
+- "line": číslo řádku (musí být ze seznamu změněných/přidaných řádků níže)
+- "severity": "critical" | "warning" | "suggestion"  
+- "message": {comment_lang}
+- "suggestion": návrh jak to udělat lépe, nebo prázdný řetězec
+
+Pokud není co komentovat, vrať: {{"comments": []}}"""
+
+# Část promptu pro konkrétní soubor
+FILE_PROMPT_TEMPLATE = """## Analyzovaný soubor: {file_path}
+## Typ souboru: {file_type}
+
+Aplikuj pravidla relevantní pro tento typ souboru.
+
+{content_section}### Diff (změny v tomto MR):
+```diff
+{diff}
+```
+
+### Řádky, které byly změněny/přidány: {changed_lines}"""
+
+FILE_CONTENT_TEMPLATE = """### Celý obsah souboru (pro kontext):
+```
+{file_content}
+```
+
+"""
+
+# Verze promptu a schématu - součást klíče cache, po změně se staré odpovědi nepoužijí
+PROMPT_VERSION = hashlib.sha256(orjson.dumps(
+    [PROMPT_PREFIX_TEMPLATE, FILE_PROMPT_TEMPLATE, FILE_CONTENT_TEMPLATE, REVIEW_SCHEMA]
+)).hexdigest()
+
+# Jeden GraphQL dotaz místo samostatných REST volání (info, diskuse, notes)
+MR_OVERVIEW_QUERY = """
+query($projectPath: ID!, $iid: String!) {
+  project(fullPath: $projectPath) {
+    mergeRequest(iid: $iid) {
+      sourceBranch
+      diffRefs { baseSha headSha startSha }
+      discussions {
+        nodes {
+          id
+          notes { nodes { id body position { newPath newLine } } }
+        }
+      }
+      notes { nodes { id body } }
+    }
+  }
+}
+"""
+
+
+def setup_logging():
+    """Nastaví logování přes frontu - vlákna jen vloží zprávu, na stdout zapisuje jeden listener."""
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
 
 def init_config():
     """Inicializuje konfiguraci z ENV proměnných."""
-    global IGNORE_PATTERNS, REVIEW_EXTENSIONS
+    global IGNORE_PATTERNS, REVIEW_EXTENSIONS, _IGNORE_SUFFIXES, _IGNORE_RE, REVIEW_RULES
+    global PROMPT_INTRO, PROMPT_COMMENT_LANG
     
     # Přidání extra ignore patterns
     if IGNORE_PATTERNS_EXTRA:
@@ -77,6 +245,18 @@ def init_config():
         extra = [e.strip() if e.strip().startswith(".") else f".{e.strip()}" 
                  for e in REVIEW_EXTENSIONS_EXTRA.split(",") if e.strip()]
         REVIEW_EXTENSIONS.update(extra)
+    REVIEW_EXTENSIONS = frozenset(REVIEW_EXTENSIONS)
+
+    # Patterns se zkompilují jednou, should_review_file pak jen porovnává
+    _IGNORE_SUFFIXES = tuple(p[1:] for p in IGNORE_PATTERNS if p.startswith("*"))
+    substrings = [
+        p[:-1] if p.endswith("/") else p
+        for p in IGNORE_PATTERNS if not p.startswith("*")
+    ]
+    _IGNORE_RE = re.compile("|".join(map(re.escape, substrings))) if substrings else None
+
+    REVIEW_RULES = load_review_rules()
+    PROMPT_INTRO, PROMPT_COMMENT_LANG = get_language_prompt(LANGUAGE)
 
 
 class AIClient:
@@ -101,63 +281,200 @@ class AIClient:
             from openai import OpenAI
             self.client = OpenAI(api_key=OPENAI_API_KEY)
             self.model = OPENAI_MODEL
-            print(f"🤖 Používám OpenAI ({self.model})")
+            logger.info(f"🤖 Používám OpenAI ({self.model})")
         else:
             from anthropic import Anthropic
             self.client = Anthropic(api_key=ANTHROPIC_API_KEY)
             self.model = ANTHROPIC_MODEL
-            print(f"🤖 Používám Anthropic ({self.model})")
-    
-    def chat(self, prompt: str) -> str:
-        if self.provider == "openai":
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=4096,
-                temperature=0.3,
-            )
-            return response.choices[0].message.content.strip()
-        else:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=4096,
-                messages=[{"role": "user", "content": prompt}],
-            )
-            return response.content[0].text.strip()
+            logger.info(f"🤖 Používám Anthropic ({self.model})")
+    
+    def chat(self, prefix: str, prompt: str, max_tokens: int = 1024) -> dict | None:
+        """Pošle dotaz složený ze statického prefixu (stejný pro celý MR) a části pro soubor.
+
+        Prefix jde vždy první a beze změny, aby ho provider mohl cachovat:
+        OpenAI cachuje shodné prefixy automaticky, Anthropic přes cache_control.
+        Odpověď useknutou limitem tokenů zkusí jednou znovu s RETRY_MAX_TOKENS.
+        Vrací objekt podle REVIEW_SCHEMA, nebo None u neúplné odpovědi.
+        """
+        complete = self._chat_openai if self.provider == "openai" else self._chat_anthropic
+        result, truncated = complete(prefix, prompt, max_tokens)
+        if truncated and max_tokens < RETRY_MAX_TOKENS:
+            logger.info(f"   🔁 Odpověď AI useknutá na {max_tokens} tokenech, zkouším {RETRY_MAX_TOKENS}")
+            result, truncated = complete(prefix, prompt, RETRY_MAX_TOKENS)
+        return result
+
+    def _chat_openai(self, prefix: str, prompt: str, max_tokens: int) -> tuple[dict | None, bool]:
+        """Vrací (odpověď, useknuto limitem tokenů)."""
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": f"{prefix}\n\n{prompt}"}],
+            max_tokens=max_tokens,
+            temperature=0,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "review", "strict": True, "schema": REVIEW_SCHEMA},
+            },
+        )
+        choice = response.choices[0]
+        if choice.finish_reason == "length" or not choice.message.content:
+            logger.warning(f"⚠️  Neúplná odpověď AI ({choice.finish_reason})")
+            return None, choice.finish_reason == "length"
+        return orjson.loads(choice.message.content), False
+
+    def _chat_anthropic(self, prefix: str, prompt: str, max_tokens: int) -> tuple[dict | None, bool]:
+        """Vrací (odpověď, useknuto limitem tokenů)."""
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            temperature=0,
+            tools=[{
+                "name": "report_issues",
+                "description": "Nahlásí nalezené problémy ve změněných řádcích.",
+                "input_schema": REVIEW_SCHEMA,
+            }],
+            tool_choice={"type": "tool", "name": "report_issues"},
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+                    {"type": "text", "text": prompt},
+                ],
+            }],
+        )
+        tool_use = next((block for block in response.content if block.type == "tool_use"), None)
+        if response.stop_reason == "max_tokens" or tool_use is None:
+            logger.warning(f"⚠️  Neúplná odpověď AI ({response.stop_reason})")
+            return None, response.stop_reason == "max_tokens"
+        return tool_use.input, False
 
 
 class GitLabClient:
     """Klient pro komunikaci s GitLab API."""
     
-    def __init__(self, base_url: str, token: str, project_id: str):
+    def __init__(self, base_url: str, token: str, project_id: str, project_path: str | None = None):
         self.base_url = base_url.rstrip("/")
         self.project_id = project_id
-        self.headers = {"PRIVATE-TOKEN": token}
+        self.project_path = project_path
+        # Jedna session = keep-alive spojení sdílená všemi vlákny
+        self.session = requests.Session()
+        self.session.headers.update({"PRIVATE-TOKEN": token})
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 502, 503, 504],
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Omezení souběhu kvůli rate limitu GitLabu
+        self._slots = threading.BoundedSemaphore(GITLAB_CONCURRENCY)
     
     def _api(self, endpoint: str) -> str:
         return f"{self.base_url}/api/v4/projects/{self.project_id}/{endpoint}"
-    
-    def get_mr_changes(self, mr_iid: str) -> dict:
-        url = self._api(f"merge_requests/{mr_iid}/changes")
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
-    
-    def get_mr_info(self, mr_iid: str) -> dict:
-        url = self._api(f"merge_requests/{mr_iid}")
-        response = requests.get(url, headers=self.headers)
+
+    def _request(
+        self, method: str, url: str, payload: dict | None = None, **kwargs,
+    ) -> requests.Response:
+        if payload is not None:
+            kwargs["data"] = orjson.dumps(payload)
+            kwargs["headers"] = {"Content-Type": "application/json"}
+        with self._slots:
+            return self.session.request(method, url, **kwargs)
+    
+    def graphql(self, query: str, variables: dict) -> dict:
+        """Provede GraphQL dotaz a vrátí jeho `data`."""
+        url = f"{self.base_url}/api/graphql"
+        response = self._request("POST", url, payload={"query": query, "variables": variables})
         response.raise_for_status()
-        return response.json()
+        result = orjson.loads(response.content)
+        if result.get("errors"):
+            raise RuntimeError(f"GraphQL chyba: {result['errors']}")
+        return result["data"]
+
+    def get_project_path(self) -> str:
+        """Vrací plnou cestu projektu (GraphQL neumí číselné ID)."""
+        if not self.project_path:
+            url = f"{self.base_url}/api/v4/projects/{self.project_id}"
+            response = self._request("GET", url)
+            response.raise_for_status()
+            self.project_path = orjson.loads(response.content)["path_with_namespace"]
+        return self.project_path
+
+    def get_mr_overview(self, mr_iid: str) -> dict:
+        """Načte info, diff_refs, diskuse a notes k MR jedním GraphQL dotazem.
+
+        Výsledek má stejný tvar jako odpovědi REST API (snake_case klíče,
+        číselná ID notes), aby s ním fungovaly stávající pomocné funkce.
+        """
+        project_path = self.get_project_path()
+        data = self.graphql(MR_OVERVIEW_QUERY, {"projectPath": project_path, "iid": str(mr_iid)})
+        # Nedostupný projekt / MR vrací GraphQL jako null, ne jako chybu
+        if data.get("project") is None:
+            raise RuntimeError(f"Projekt {project_path} nenalezen nebo k němu token nemá přístup")
+        mr = data["project"].get("mergeRequest")
+        if mr is None:
+            raise RuntimeError(f"MR !{mr_iid} v projektu {project_path} nenalezen nebo k němu token nemá přístup")
+        diff_refs = mr.get("diffRefs") or {}
+
+        discussions = []
+        for discussion in mr["discussions"]["nodes"]:
+            notes = []
+            for note in discussion["notes"]["nodes"]:
+                position = note.get("position")
+                notes.append({
+                    "id": _gid_to_id(note["id"]),
+                    "body": note.get("body", ""),
+                    "position": {
+                        "new_path": position.get("newPath"),
+                        "new_line": position.get("newLine"),
+                    } if position else None,
+                })
+            discussions.append({"id": _gid_to_id(discussion["id"]), "notes": notes})
+
+        return {
+            "source_branch": mr["sourceBranch"],
+            "diff_refs": {
+                "base_sha": diff_refs.get("baseSha"),
+                "head_sha": diff_refs.get("headSha"),
+                "start_sha": diff_refs.get("startSha"),
+            },
+            "discussions": discussions,
+            "notes": [
+                {"id": _gid_to_id(note["id"]), "body": note.get("body", "")}
+                for note in mr["notes"]["nodes"]
+            ],
+        }
+
+    def iter_mr_changes(self, mr_iid: str) -> Iterator[dict]:
+        """Streamuje změny MR - vrací jednotlivé soubory průběžně, jak dorazí."""
+        url = self._api(f"merge_requests/{mr_iid}/changes")
+        with self._request("GET", url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            yield from ijson.items(response.raw, "changes.item")
     
     def get_file_content(self, file_path: str, ref: str) -> str | None:
         import urllib.parse
         encoded_path = urllib.parse.quote(file_path, safe="")
         url = self._api(f"repository/files/{encoded_path}/raw?ref={ref}")
-        response = requests.get(url, headers=self.headers)
-        if response.status_code == 404:
-            return None
-        response.raise_for_status()
-        return response.text
+        # Stream - z velkých souborů se stáhne jen prvních MAX_FILE_SIZE znaků
+        with self._request("GET", url, stream=True) as response:
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            response.encoding = response.encoding or "utf-8"
+            chunks = []
+            total = 0
+            for chunk in response.iter_content(chunk_size=8192, decode_unicode=True):
+                chunks.append(chunk)
+                total += len(chunk)
+                if total >= MAX_FILE_SIZE:
+                    break
+        return "".join(chunks)[:MAX_FILE_SIZE]
     
     def create_mr_discussion(
         self, mr_iid: str, body: str, file_path: str, new_line: int,
@@ -175,70 +492,55 @@ class GitLabClient:
                 "new_line": new_line,
             },
         }
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = self._request("POST", url, payload=payload)
         if response.status_code >= 400:
-            print(f"⚠️  Nepodařilo se vytvořit komentář: {response.text}")
+            logger.warning(f"⚠️  Nepodařilo se vytvořit komentář: {response.text}")
         return response
     
     def create_mr_note(self, mr_iid: str, body: str):
         url = self._api(f"merge_requests/{mr_iid}/notes")
-        response = requests.post(url, headers=self.headers, json={"body": body})
-        response.raise_for_status()
-        return response.json()
-
-    def get_mr_discussions(self, mr_iid: str) -> list:
-        """Načte všechny diskuse (inline komentáře) pro MR."""
-        url = self._api(f"merge_requests/{mr_iid}/discussions")
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
-
-    def get_mr_notes(self, mr_iid: str) -> list:
-        """Načte všechny notes (komentáře na úrovni MR)."""
-        url = self._api(f"merge_requests/{mr_iid}/notes")
-        response = requests.get(url, headers=self.headers)
+        response = self._request("POST", url, payload={"body": body})
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
 
     def update_mr_note(self, mr_iid: str, note_id: int, body: str):
         """Aktualizuje existující note."""
         url = self._api(f"merge_requests/{mr_iid}/notes/{note_id}")
-        response = requests.put(url, headers=self.headers, json={"body": body})
+        response = self._request("PUT", url, payload={"body": body})
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
 
     def resolve_discussion(self, mr_iid: str, discussion_id: str):
         """Označí diskusi jako vyřešenou."""
         url = self._api(f"merge_requests/{mr_iid}/discussions/{discussion_id}")
-        response = requests.put(url, headers=self.headers, json={"resolved": True})
+        response = self._request("PUT", url, payload={"resolved": True})
         if response.status_code >= 400:
-            print(f"⚠️  Nepodařilo se resolvnout diskusi: {response.text}")
+            logger.warning(f"⚠️  Nepodařilo se resolvnout diskusi: {response.text}")
         return response
 
     def delete_mr_note(self, mr_iid: str, note_id: int):
         """Smaže note (komentář) z MR."""
         url = self._api(f"merge_requests/{mr_iid}/notes/{note_id}")
-        response = requests.delete(url, headers=self.headers)
+        response = self._request("DELETE", url)
         if response.status_code >= 400:
-            print(f"⚠️  Nepodařilo se smazat note: {response.text}")
+            logger.warning(f"⚠️  Nepodařilo se smazat note: {response.text}")
         return response
 
 
+def _gid_to_id(gid: str) -> int | str:
+    """Převede GraphQL global ID (gid://gitlab/Note/123) na REST ID."""
+    raw_id = gid.rsplit("/", 1)[-1]
+    return int(raw_id) if raw_id.isdigit() else raw_id
+
+
 def should_review_file(file_path: str) -> bool:
     """Rozhodne, zda soubor reviewovat."""
     path = Path(file_path)
-    
-    for pattern in IGNORE_PATTERNS:
-        if pattern.startswith("*"):
-            if path.suffix == pattern[1:] or path.name.endswith(pattern[1:]):
-                return False
-        elif pattern.endswith("/"):
-            if pattern[:-1] in file_path:
-                return False
-        elif pattern in file_path:
-            return False
-    
-    return path.suffix.lower() in REVIEW_EXTENSIONS
+    return (
+        path.suffix.lower() in REVIEW_EXTENSIONS
+        and not path.name.endswith(_IGNORE_SUFFIXES)
+        and not (_IGNORE_RE and _IGNORE_RE.search(file_path))
+    )
 
 
 def parse_diff_for_new_lines(diff: str) -> list[int]:
@@ -246,86 +548,103 @@ def parse_diff_for_new_lines(diff: str) -> list[int]:
     new_lines = []
     current_new_line = 0
     
-    for line in diff.split("\n"):
-        if line.startswith("@@"):
-            try:
-                plus_part = line.split("+")[1].split("@@")[0].strip()
-                if "," in plus_part:
-                    current_new_line = int(plus_part.split(",")[0])
-                else:
-                    current_new_line = int(plus_part)
-            except (IndexError, ValueError):
-                continue
-        elif line.startswith("+") and not line.startswith("+++"):
+    # Jeden průchod regexem přes celý diff, match = začátek každého řádku
+    for match in _DIFF_LINE_RE.finditer(diff):
+        start, bad_hunk, sign = match.group("start", "bad_hunk", "sign")
+        if start:
+            current_new_line = int(start)
+        elif bad_hunk or sign == "-" or sign == "\\":
+            continue
+        elif sign == "+":
             new_lines.append(current_new_line)
             current_new_line += 1
-        elif line.startswith("-") and not line.startswith("---"):
-            pass
-        elif not line.startswith("\\"):
+        else:
             current_new_line += 1
     
     return new_lines
 
 
+def is_trivial_diff(file_path: str, diff: str) -> bool:
+    """Rozhodne, zda diff obsahuje jen triviální změny (prázdné řádky, komentáře, importy)."""
+    added = _ADDED_LINE_RE.findall(diff)
+    if len(added) < MIN_LINES_FOR_REVIEW:
+        return True
+
+    has_preprocessor = Path(file_path).suffix.lower() in _C_FAMILY_SUFFIXES
+
+    for line in added:
+        line = line.strip()
+        if not line or line.startswith(_TRIVIAL_IMPORT_PREFIXES):
+            continue
+        is_comment = line == "*" or line.startswith(_TRIVIAL_COMMENT_PREFIXES)
+        if is_comment and not (
+            _HASH_ATTRIBUTE_RE.match(line)
+            or (has_preprocessor and _PREPROCESSOR_RE.match(line))
+        ):
+            continue
+        return False
+    return True
+
+
+@lru_cache(maxsize=None)
 def load_review_rules() -> str:
     """Načte pravidla pro review."""
     # 1. Přímo z ENV
     if REVIEW_RULES_CONTENT:
-        print("📋 Pravidla načtena z REVIEW_RULES_CONTENT")
+        logger.info("📋 Pravidla načtena z REVIEW_RULES_CONTENT")
         return REVIEW_RULES_CONTENT
     
     # 2. Ze souboru v projektu (pokud existuje)
     project_rules = Path(os.environ.get("CI_PROJECT_DIR", "")) / "review_rules.md"
     if project_rules.exists():
-        print(f"📋 Pravidla načtena z projektu: {project_rules}")
+        logger.info(f"📋 Pravidla načtena z projektu: {project_rules}")
         return project_rules.read_text()
     
     # 3. Z REVIEW_RULES_FILE
     rules_file = Path(REVIEW_RULES_FILE)
     if rules_file.exists():
-        print(f"📋 Pravidla načtena z: {rules_file}")
+        logger.info(f"📋 Pravidla načtena z: {rules_file}")
         return rules_file.read_text()
     
     # 4. Fallback
-    print("📋 Používám výchozí pravidla")
+    logger.info("📋 Používám výchozí pravidla")
     return "Základní pravidla: SOLID, Clean Code, DRY, bezpečnost."
 
 
+def _detect_php(file_path: str) -> str:
+    return next(
+        (file_type for marker, file_type in PHP_FILE_TYPES.items() if marker in file_path),
+        "PHP/Laravel",
+    )
+
+
+def _detect_js(file_path: str) -> str:
+    lower_path = file_path.lower()
+    if "/composables/" in lower_path or "/use" in lower_path:
+        return "Vue Composable"
+    elif "/components/" in lower_path:
+        return "Frontend komponenta"
+    return "JavaScript/TypeScript"
+
+
+# Detekce typu podle přípony - jeden lookup místo řetězce endswith
+FILE_TYPE_HANDLERS = {
+    ".php": _detect_php,
+    ".vue": lambda _: "Vue/Inertia komponenta",
+    ".js": _detect_js,
+    ".ts": _detect_js,
+    ".jsx": _detect_js,
+    ".tsx": _detect_js,
+    ".py": lambda _: "Python",
+    ".go": lambda _: "Go",
+}
+
+
+@lru_cache(maxsize=None)
 def detect_file_type(file_path: str) -> str:
     """Detekuje typ souboru pro lepší kontext."""
-    if file_path.endswith(".php"):
-        if "/Controllers/" in file_path:
-            return "Laravel Controller"
-        elif "/Models/" in file_path:
-            return "Laravel Model"
-        elif "/Services/" in file_path:
-            return "Laravel Service"
-        elif "/Requests/" in file_path:
-            return "Laravel Form Request"
-        elif "/Resources/" in file_path:
-            return "Laravel Resource"
-        elif "/Actions/" in file_path:
-            return "Laravel Action"
-        elif "/Jobs/" in file_path:
-            return "Laravel Job"
-        elif "/Events/" in file_path:
-            return "Laravel Event"
-        elif "/Listeners/" in file_path:
-            return "Laravel Listener"
-        return "PHP/Laravel"
-    elif file_path.endswith(".vue"):
-        return "Vue/Inertia komponenta"
-    elif file_path.endswith((".js", ".ts", ".jsx", ".tsx")):
-        if "/composables/" in file_path.lower() or "/use" in file_path.lower():
-            return "Vue Composable"
-        elif "/components/" in file_path.lower():
-            return "Frontend komponenta"
-        return "JavaScript/TypeScript"
-    elif file_path.endswith(".py"):
-        return "Python"
-    elif file_path.endswith(".go"):
-        return "Go"
-    return "Zdrojový kód"
+    handler = FILE_TYPE_HANDLERS.get(Path(file_path).suffix)
+    return handler(file_path) if handler else "Zdrojový kód"
 
 
 def get_language_prompt(lang: str) -> tuple[str, str]:
@@ -341,6 +660,16 @@ def get_language_prompt(lang: str) -> tuple[str, str]:
     )
 
 
+@lru_cache(maxsize=None)
+def build_prompt_prefix(rules: str) -> str:
+    """Sestaví statický prefix promptu (jednou za běh)."""
+    return PROMPT_PREFIX_TEMPLATE.format_map({
+        "intro": PROMPT_INTRO,
+        "rules": rules,
+        "comment_lang": PROMPT_COMMENT_LANG,
+    })
+
+
 def analyze_with_ai(
     ai_client: AIClient,
     file_path: str,
@@ -351,70 +680,61 @@ def analyze_with_ai(
 ) -> list[dict]:
     """Analyzuje kód pomocí AI a vrací seznam komentářů."""
     
-    file_type = detect_file_type(file_path)
-    intro, comment_lang = get_language_prompt(LANGUAGE)
-    
-    prompt = f"""{intro}
-
-## Pravidla a principy, které kontroluješ:
-{rules}
-
-## Analyzovaný soubor: {file_path}
-## Typ souboru: {file_type}
-
-Aplikuj pravidla relevantní pro tento typ souboru.
-
-### Celý obsah souboru (pro kontext):
-```
-{file_content[:MAX_FILE_SIZE]}
-```
-
-### Diff (změny v tomto MR):
-```diff
-{diff}
-```
-
-### Řádky, které byly změněny/přidány: {changed_lines}
-
-## Tvůj úkol:
-1. Analyzuj POUZE změněné řádky (ne celý soubor)
-2. Hledej problémy s architekturou, designem, čitelností, principy SOLID, DRY atd.
-3. NEKOMENTUJ drobnosti jako chybějící mezery nebo formátování (to řeší linter)
-4. Komentuj pouze DŮLEŽITÉ problémy, které stojí za pozornost
-
-## Formát odpovědi:
-Vrať POUZE validní JSON pole. Každý objekt má:
-- "line": číslo řádku (musí být z {changed_lines})
-- "severity": "critical" | "warning" | "suggestion"  
-- "message": {comment_lang}
-- "suggestion": volitelně - návrh jak to udělat lépe
-
-Pokud není co komentovat, vrať prázdné pole: []
-
-POUZE JSON, žádný další text před ani po:"""
-
-    response_text = ai_client.chat(prompt)
-    
-    try:
-        if response_text.startswith("```"):
-            response_text = response_text.split("```")[1]
-            if response_text.startswith("json"):
-                response_text = response_text[4:]
-        
-        comments = json.loads(response_text)
-        valid_comments = [
-            c for c in comments 
-            if isinstance(c, dict) 
-            and c.get("line") in changed_lines
-            and c.get("message")
-        ]
-        return valid_comments
-        
-    except json.JSONDecodeError as e:
-        print(f"⚠️  Nepodařilo se parsovat odpověď: {e}")
-        print(f"Odpověď: {response_text[:500]}")
+    # Cache podle obsahu - stejný vstup = stejná odpověď bez volání AI
+    cache_file = None
+    if REVIEW_CACHE_DIR:
+        key_source = "\0".join((
+            file_path, file_content[:MAX_FILE_SIZE], diff, rules,
+            ai_client.model, LANGUAGE, PROMPT_VERSION,
+        ))
+        key = hashlib.sha256(key_source.encode()).hexdigest()
+        cache_file = Path(REVIEW_CACHE_DIR) / f"{key}.json"
+        if cache_file.exists():
+            # Poškozený záznam = cache miss, přepíše se novou odpovědí
+            try:
+                cached = orjson.loads(cache_file.read_bytes())
+            except (OSError, orjson.JSONDecodeError) as e:
+                logger.warning(f"   ⚠️  Neplatný záznam v cache ({cache_file.name}): {e}")
+            else:
+                logger.info(f"   ♻️  Odpověď z cache: {file_path}")
+                return cached
+
+    content_section = ""
+    if file_content:
+        content_section = FILE_CONTENT_TEMPLATE.format_map({"file_content": file_content[:MAX_FILE_SIZE]})
+
+    prefix = build_prompt_prefix(rules)
+    prompt = FILE_PROMPT_TEMPLATE.format_map({
+        "file_path": file_path,
+        "file_type": detect_file_type(file_path),
+        "content_section": content_section,
+        "diff": diff,
+        "changed_lines": changed_lines,
+    })
+
+    response = ai_client.chat(prefix, prompt)
+    if response is None:
         return []
 
+    valid_comments = [
+        c for c in response.get("comments", [])
+        if isinstance(c, dict)
+        and c.get("line") in changed_lines
+        and c.get("message")
+    ]
+    if cache_file:
+        # Atomický zápis - přerušený běh nezanechá v cache useknutý soubor
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_file.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(orjson.dumps(valid_comments))
+            os.replace(tmp_path, cache_file)
+        except OSError:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+    return valid_comments
+
 
 def format_comment(comment: dict) -> str:
     """Formátuje komentář pro GitLab."""
@@ -471,7 +791,45 @@ def get_existing_ai_comments(discussions: list) -> list[dict]:
     return existing
 
 
+def _review_one(
+    gitlab: GitLabClient,
+    ai_client: AIClient,
+    change: dict,
+    source_branch: str,
+    rules: str,
+) -> tuple[str, list[dict]]:
+    """Zreviewuje jeden změněný soubor, vrací (cesta, komentáře)."""
+    file_path = change.get("new_path")
+    diff = change.get("diff", "")
+
+    logger.info(f"🔎 Analyzuji: {file_path}")
+
+    changed_lines = parse_diff_for_new_lines(diff)
+    if not changed_lines:
+        return file_path, []
+
+    if is_trivial_diff(file_path, diff):
+        logger.info(f"   ⏭️  Triviální změna, bez AI: {file_path}")
+        return file_path, []
+
+    # Kontext z diffu většinou stačí, celý soubor jen na vyžádání
+    file_content = ""
+    if REVIEW_INCLUDE_FULL_FILE:
+        file_content = gitlab.get_file_content(file_path, source_branch)
+        if not file_content:
+            logger.warning(f"   ⚠️  Nelze načíst obsah: {file_path}")
+            return file_path, []
+
+    comments = analyze_with_ai(
+        ai_client, file_path, file_content, diff, changed_lines, rules,
+    )
+
+    logger.info(f"   💬 Komentářů ({file_path}): {len(comments)}")
+    return file_path, comments
+
+
 def main():
+    setup_logging()
     init_config()
     
     # Validace
@@ -486,91 +844,91 @@ def main():
         missing.append("OPENAI_API_KEY nebo ANTHROPIC_API_KEY")
     
     if missing:
-        print(f"❌ Chybí proměnné prostředí: {', '.join(missing)}")
+        logger.error(f"❌ Chybí proměnné prostředí: {', '.join(missing)}")
         sys.exit(1)
     
-    print(f"🔍 RejPAL pro MR !{MR_IID}")
+    logger.info(f"🔍 RejPAL pro MR !{MR_IID}")
     
-    gitlab = GitLabClient(GITLAB_URL, GITLAB_TOKEN, PROJECT_ID)
+    gitlab = GitLabClient(GITLAB_URL, GITLAB_TOKEN, PROJECT_ID, PROJECT_PATH)
     ai_client = AIClient(provider=AI_PROVIDER)
     
-    mr_info = gitlab.get_mr_info(MR_IID)
-    mr_changes = gitlab.get_mr_changes(MR_IID)
+    mr_overview = gitlab.get_mr_overview(MR_IID)
     
-    source_branch = mr_info["source_branch"]
-    diff_refs = mr_changes.get("diff_refs", {})
+    source_branch = mr_overview["source_branch"]
+    diff_refs = mr_overview["diff_refs"]
     base_sha = diff_refs.get("base_sha")
     head_sha = diff_refs.get("head_sha")
     start_sha = diff_refs.get("start_sha")
     
-    print(f"📁 Branch: {source_branch}")
-    print(f"📝 Změněných souborů: {len(mr_changes.get('changes', []))}")
-    
-    rules = load_review_rules()
+    logger.info(f"📁 Branch: {source_branch}")
 
     # Smazat existující AI komentáře (cleanup před novým review)
-    discussions = gitlab.get_mr_discussions(MR_IID)
-    existing_ai_comments = get_existing_ai_comments(discussions)
+    existing_ai_comments = get_existing_ai_comments(mr_overview["discussions"])
     deleted_count = 0
     if existing_ai_comments:
-        print(f"🗑️  Mažu {len(existing_ai_comments)} starých AI komentářů...")
-        for comment in existing_ai_comments:
-            gitlab.delete_mr_note(MR_IID, comment["note_id"])
-            deleted_count += 1
-        print(f"✅ Smazáno {deleted_count} starých komentářů")
+        logger.info(f"🗑️  Mažu {len(existing_ai_comments)} starých AI komentářů...")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = executor.map(
+                lambda c: gitlab.delete_mr_note(MR_IID, c["note_id"]), existing_ai_comments,
+            )
+            deleted_count = sum(1 for r in responses if r.status_code < 400)
+        logger.info(f"✅ Smazáno {deleted_count} starých komentářů")
 
     # Najít nebo vytvořit sumář (bude první komentář = nahoře)
-    notes = gitlab.get_mr_notes(MR_IID)
-    summary_note_id = find_existing_summary_note(notes)
+    summary_note_id = find_existing_summary_note(mr_overview["notes"])
     if not summary_note_id:
         placeholder = "## RejPAL\n\n⏳ Probíhá analýza..."
         result = gitlab.create_mr_note(MR_IID, placeholder)
         summary_note_id = result.get("id")
-        print("📝 Sumář vytvořen (placeholder)")
+        logger.info("📝 Sumář vytvořen (placeholder)")
     else:
-        print("📝 Existující sumář nalezen")
+        logger.info("📝 Existující sumář nalezen")
 
     total_comments = 0
     reviewed_files = 0
 
-    for change in mr_changes.get("changes", []):
-        file_path = change.get("new_path")
-        diff = change.get("diff", "")
-
-        if not should_review_file(file_path):
-            print(f"⏭️  Přeskakuji: {file_path}")
-            continue
-
-        if change.get("deleted_file"):
-            continue
-
-        print(f"🔎 Analyzuji: {file_path}")
-        reviewed_files += 1
-
-        changed_lines = parse_diff_for_new_lines(diff)
-        if not changed_lines:
-            continue
-
-        file_content = gitlab.get_file_content(file_path, source_branch)
-        if not file_content:
-            print(f"   ⚠️  Nelze načíst obsah")
-            continue
-
-        comments = analyze_with_ai(
-            ai_client, file_path, file_content, diff, changed_lines, rules,
-        )
-
-        print(f"   💬 Komentářů: {len(comments)}")
+    # AI analýza běží paralelně a začíná už během stahování seznamu změn,
+    # komentáře se zakládají postupně podle dokončení
+    with ThreadPoolExecutor(max_workers=REVIEW_CONCURRENCY) as executor:
+        futures = {}  # future -> klíč diffu
+        duplicates = {}  # klíč diffu -> další soubory se stejným diffem
+        reviewable_count = 0
+        for change in gitlab.iter_mr_changes(MR_IID):
+            # Filtr jen podle cesty - do poolu jdou pouze soubory k review
+            file_path = change.get("new_path", "")
+            if change.get("deleted_file"):
+                continue
+            if not should_review_file(file_path):
+                logger.info(f"⏭️  Přeskakuji: {file_path}")
+                continue
+            reviewable_count += 1
 
-        for comment in comments:
-            line = comment.get("line")
-            body = format_comment(comment)
-            gitlab.create_mr_discussion(
-                MR_IID, body, file_path, line, base_sha, head_sha, start_sha,
+            # Soubory se shodným diffem (codemod, přejmenování) jdou do AI jen jednou
+            diff_key = hashlib.sha256(change.get("diff", "").encode()).hexdigest()
+            if diff_key in duplicates:
+                logger.info(f"♻️  Stejný diff jako jiný soubor: {file_path}")
+                duplicates[diff_key].append(file_path)
+                continue
+            duplicates[diff_key] = []
+            future = executor.submit(
+                _review_one, gitlab, ai_client, change, source_branch, REVIEW_RULES,
             )
-            total_comments += 1
-
-    print(f"\n✅ Hotovo! Souborů: {reviewed_files}, Komentářů: {total_comments}, Smazáno starých: {deleted_count}")
+            futures[future] = diff_key
+        logger.info(f"📝 Souborů k review: {reviewable_count}")
+
+        for future in as_completed(futures):
+            file_path, comments = future.result()
+            for target_path in [file_path, *duplicates[futures[future]]]:
+                reviewed_files += 1
+                for comment in comments:
+                    line = comment.get("line")
+                    body = format_comment(comment)
+                    gitlab.create_mr_discussion(
+                        MR_IID, body, target_path, line, base_sha, head_sha, start_sha,
+                    )
+                    total_comments += 1
+
+    logger.info(f"\n✅ Hotovo! Souborů: {reviewed_files}, Komentářů: {total_comments}, Smazáno starých: {deleted_count}")
 
     # Aktualizovat sumář s finálními statistikami
     summary = f"""## RejPAL
@@ -586,7 +944,7 @@ def main():
 <sub>Generováno automaticky</sub>
 """
     gitlab.update_mr_note(MR_IID, summary_note_id, summary)
-    print("📝 Sumář aktualizován")
+    logger.info("📝 Sumář aktualizován")
 
 
 if __name__ == "__main__":